@@ -1,13 +1,18 @@
 import paho.mqtt.client as mqtt
+from paho.mqtt.properties import Properties
+from paho.mqtt.packettypes import PacketTypes
 import ssl
 import time
-import json
+import threading
+import itertools
 import random
 import csv
 import os
+import atexit
 import warnings
-from datetime import datetime
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 
 # ---------- CONFIGURATION ----------
 warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -32,19 +37,66 @@ LOG_FILE = r"D:\IOTCoreCert\iot_publisher.log"
 TEMP_RANGE = (22.0, 30.0)
 HUMIDITY_RANGE = (35.0, 65.0)
 PUBLISH_INTERVAL = 5  # seconds
+SAMPLE_INTERVAL = 0.5  # seconds between sensor readings
+BATCH_SIZE = int(PUBLISH_INTERVAL / SAMPLE_INTERVAL)  # readings per MQTT message
+CSV_FLUSH_ROWS = 64  # flush the CSV buffer every N rows
+SUMMARY_INTERVAL = 60  # seconds between publish rate summaries
 
 # ---------- LOGGING SETUP ----------
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# Records are only queued by the publisher; a listener thread formats
+# them and writes to the log file and console
+log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+log_handlers = [
+    logging.FileHandler(LOG_FILE, encoding='utf-8'),
+    logging.StreamHandler()
+]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, *log_handlers)
+
+root_logger = logging.getLogger()
+root_logger.setLevel(logging.INFO)
+root_logger.addHandler(QueueHandler(log_queue))
 logger = logging.getLogger(__name__)
 
+# Message templates; the constant device_id is serialized once at load and
+# the variable fields are filled with %-formatting instead of json.dumps
+_BATCH_PREFIX = b'{"device_id":"' + CLIENT_ID.encode('utf-8') + b'","samples":['
+_BATCH_SUFFIX = b']}'
+_SAMPLE_TMPL = ('{"device_id":"' + CLIENT_ID + '","temperature":%.2f,"humidity":%.1f,'
+                '"timestamp":"%s","message_id":"%s"}')
+
+# Local generator so sampling does not contend on the shared module instance
+_rng = random.Random()
+
+# Sensor ranges scaled to the reported precision (0.01 °C, 0.1 %RH)
+_TEMP_BASE, _TEMP_SPAN = TEMP_RANGE[0] * 100, (TEMP_RANGE[1] - TEMP_RANGE[0]) * 100
+_HUM_BASE, _HUM_SPAN = HUMIDITY_RANGE[0] * 10, (HUMIDITY_RANGE[1] - HUMIDITY_RANGE[0]) * 10
+
+# Message ids count up from the start time, so they stay unique across restarts
+_msg_ids = itertools.count(int(time.time()) * 10000)
+
+# Cached "YYYY-MM-DDTHH:MM:SS" prefix for the current second
+_ts_second = None
+_ts_prefix = ""
+
+# CSV log handle, kept open for the lifetime of the publisher
+_csv_file = None
+_csv_writer = None
+_csv_rows = 0  # rows written since the last flush
+_csv_row = [None, CLIENT_ID, None, None]  # reused for every row; device_id is constant
+
 # ---------- VALIDATION ----------
+def scan_directory(directory):
+    """Return {normcased name: name} for the files in a directory"""
+    try:
+        return {os.path.normcase(entry.name): entry.name
+                for entry in os.scandir(directory) if entry.is_file()}
+    except FileNotFoundError:
+        return {}
+
 def validate_files():
     """Validate that all required files exist"""
     missing_files = []
@@ -54,8 +106,16 @@ def validate_files():
         (KEY_PATH, "Private key")
     ]
     
+    # One scan per distinct directory instead of a stat per file
+    listings = {}
+    for path, _ in file_checks:
+        directory = os.path.dirname(path)
+        if directory not in listings:
+            listings[directory] = scan_directory(directory)
+    
     for path, desc in file_checks:
-        if not os.path.exists(path):
+        present = listings[os.path.dirname(path)]
+        if os.path.normcase(os.path.basename(path)) not in present:
             missing_files.append(f"{desc}: {path}")
         else:
             logger.info("Found: %s", path)
@@ -65,54 +125,133 @@ def validate_files():
         logger.error(error_msg)
         
         # List what files actually exist
-        logger.info("Files in directory:")
-        for file in os.listdir(r"D:\IOTCoreCert"):
-            if file.endswith(('.pem', '.crt', '.key')):
-                logger.info("  - %s", file)
+        for directory, present in listings.items():
+            logger.info("Files in %s:", directory)
+            for file in sorted(present.values()):
+                if file.endswith(('.pem', '.crt', '.key')):
+                    logger.info("  - %s", file)
                 
         raise FileNotFoundError(error_msg)
     
     logger.info("All certificate files verified")
 
 def setup_csv():
-    """Initialize CSV file with headers if it doesn't exist"""
-    if not os.path.exists(CSV_FILE):
-        try:
-            with open(CSV_FILE, "w", newline="", encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(["timestamp", "device_id", "temperature", "humidity"])
+    """Open the CSV file for appending, writing headers if it doesn't exist"""
+    global _csv_file, _csv_writer
+    is_new = not os.path.exists(CSV_FILE)
+    try:
+        _csv_file = open(CSV_FILE, "a", newline="", encoding='utf-8', buffering=1 << 16)
+        atexit.register(_csv_file.close)
+        _csv_writer = csv.writer(_csv_file)
+        if is_new:
+            _csv_writer.writerow(["timestamp", "device_id", "temperature", "humidity"])
+            _csv_file.flush()
             logger.info("Created new CSV file: %s", CSV_FILE)
-        except Exception as e:
-            logger.error("Failed to create CSV file: %s", e)
-            raise
-    else:
-        logger.info("CSV file already exists: %s", CSV_FILE)
+        else:
+            logger.info("CSV file already exists: %s", CSV_FILE)
+    except Exception as e:
+        logger.error("Failed to open CSV file: %s", e)
+        raise
+    return _csv_writer
+
+def close_csv():
+    """Flush and close the CSV file"""
+    if _csv_file and not _csv_file.closed:
+        _csv_file.close()
 
 # ---------- MQTT CLIENT ----------
+class ResumableSSLContext(ssl.SSLContext):
+    """SSL context that offers the last saved TLS session when paho reconnects"""
+    session = None
+    
+    def wrap_socket(self, sock, *args, **kwargs):
+        if self.session is not None and kwargs.get("session") is None:
+            kwargs["session"] = self.session
+        return super().wrap_socket(sock, *args, **kwargs)
+
 class IoTClient:
     def __init__(self):
         self.client = None
         self.is_connected = False
+        self.ssl_context = None
+        self._connected_evt = threading.Event()  # set on any CONNACK
+        self.topic_alias_max = 0  # aliases the broker accepts from us
+        self.topic_aliases = {}  # topic -> PUBLISH properties carrying its alias
+        # Guards the alias state, which on_connect resets on paho's network thread
+        self._alias_lock = threading.Lock()
+        
+    def create_ssl_context(self):
+        """Build the mutual-TLS context for AWS IoT Core"""
+        ctx = ResumableSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        ctx.load_verify_locations(cafile=CA_PATH)
+        ctx.load_cert_chain(certfile=CERT_PATH, keyfile=KEY_PATH)
+        ctx.set_alpn_protocols(["x-amzn-mqtt-ca"])
+        return ctx
+    
+    def save_tls_session(self, client):
+        """Keep the TLS session of the current connection for the next reconnect"""
+        sock = client.socket()
+        if isinstance(sock, ssl.SSLSocket) and sock.session is not None:
+            if sock.session_reused:
+                logger.info("TLS session resumed")
+            self.ssl_context.session = sock.session
+        
+    def restore_aliased_topics(self, client):
+        """Give unacknowledged alias-only publishes their full topic back.
+        
+        Topic aliases only live for one network connection, and paho re-sends
+        pending QoS 1 messages right after on_connect returns. This relies on
+        paho 1.6 internals (_out_message_mutex, _out_messages); see the
+        version note in the README before upgrading paho. Call with
+        _alias_lock held.
+        """
+        aliased = {id(props): topic for topic, props in self.topic_aliases.items()}
+        with client._out_message_mutex:
+            for msg in client._out_messages.values():
+                topic = aliased.get(id(msg.properties))
+                if topic is not None and not msg.topic:
+                    msg.topic = topic.encode('utf-8')
+                    msg.properties = None
+    
+    def topic_alias(self, topic):
+        """Return the (topic, properties) to publish with, using an MQTT 5 topic alias.
+        
+        Call with _alias_lock held.
+        """
+        props = self.topic_aliases.get(topic)
+        if props is not None:
+            return "", props
+        if len(self.topic_aliases) < self.topic_alias_max:
+            # First use sends the full topic together with the alias to register it
+            props = Properties(PacketTypes.PUBLISH)
+            props.TopicAlias = len(self.topic_aliases) + 1
+            self.topic_aliases[topic] = props
+            return topic, props
+        return topic, None
         
     def on_connect(self, client, userdata, flags, rc, properties=None):
         """Callback for when the client receives a CONNACK response from the server"""
-        if rc == 0:
-            self.is_connected = True
-            logger.info("Connected to AWS IoT Core")
-            logger.info("Publishing to topic: %s", TOPIC)
-        else:
-            self.is_connected = False
-            error_codes = {
-                1: "Connection refused - incorrect protocol version",
-                2: "Connection refused - invalid client identifier", 
-                3: "Connection refused - server unavailable",
-                4: "Connection refused - bad username or password",
-                5: "Connection refused - not authorised"
-            }
-            error_msg = error_codes.get(rc, f"Unknown error code: {rc}")
-            logger.error("Connection failed: %s", error_msg)
+        try:
+            if rc == 0:
+                # Session tickets have arrived by the time CONNACK is read
+                self.save_tls_session(client)
+                with self._alias_lock:
+                    self.restore_aliased_topics(client)
+                    self.topic_aliases = {}
+                    self.topic_alias_max = getattr(properties, "TopicAliasMaximum", 0)
+                # Only publish once the aliases of the old connection are gone
+                self.is_connected = True
+                logger.info("Connected to AWS IoT Core")
+                logger.info("Publishing to topic: %s", TOPIC)
+            else:
+                self.is_connected = False
+                # Under MQTT 5, rc is a ReasonCodes object whose str() is the reason name
+                logger.error("Connection failed: %s (reason code %s)", rc, getattr(rc, "value", rc))
+        finally:
+            # Always wake connect(), even if handling the CONNACK failed
+            self._connected_evt.set()
     
-    def on_disconnect(self, client, userdata, rc):
+    def on_disconnect(self, client, userdata, rc, properties=None):
         """Callback for when the client disconnects from the broker"""
         self.is_connected = False
         if rc != 0:
@@ -120,10 +259,6 @@ class IoTClient:
         else:
             logger.info("Disconnected from AWS IoT Core")
     
-    def on_publish(self, client, userdata, mid):
-        """Callback when a message is published"""
-        logger.debug("Message %s published successfully", mid)
-    
     def on_message(self, client, userdata, msg):
         """Callback when a message is received"""
         logger.info("Received message from %s: %s", msg.topic, msg.payload.decode())
@@ -134,7 +269,6 @@ class IoTClient:
             self.client = mqtt.Client(client_id=CLIENT_ID, protocol=mqtt.MQTTv5)
             self.client.on_connect = self.on_connect
             self.client.on_disconnect = self.on_disconnect
-            self.client.on_publish = self.on_publish
             self.client.on_message = self.on_message
             
             # Configure TLS/SSL
@@ -143,26 +277,20 @@ class IoTClient:
             logger.info("  Cert: %s", CERT_PATH)
             logger.info("  Key: %s", KEY_PATH)
             
-            self.client.tls_set(
-                ca_certs=CA_PATH,
-                certfile=CERT_PATH,
-                keyfile=KEY_PATH,
-                tls_version=ssl.PROTOCOL_TLS_CLIENT,
-                cert_reqs=ssl.CERT_REQUIRED
-            )
+            self.ssl_context = self.create_ssl_context()
+            self.client.tls_set_context(self.ssl_context)
             
             logger.info("Connecting to %s...", ENDPOINT)
             self.client.connect(ENDPOINT, port=8883, keepalive=60)
+            self._connected_evt.clear()
             self.client.loop_start()
             
-            # Wait for connection
-            timeout = 10
-            start_time = time.time()
-            while not self.is_connected and (time.time() - start_time) < timeout:
-                time.sleep(0.1)
+            # Wait for CONNACK
+            if not self._connected_evt.wait(timeout=10):
+                raise Exception("Connection timeout")
             
             if not self.is_connected:
-                raise Exception("Connection timeout")
+                raise Exception("Connection refused")
                 
             return True
             
@@ -177,7 +305,11 @@ class IoTClient:
             return False
         
         try:
-            result = self.client.publish(topic, message, qos=1)
+            # Held until paho has queued the message, so on_connect either sees
+            # it in the outgoing queue or resets the aliases before it is built
+            with self._alias_lock:
+                topic, properties = self.topic_alias(topic)
+                result = self.client.publish(topic, message, qos=1, properties=properties)
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
                 return True
             else:
@@ -197,41 +329,71 @@ class IoTClient:
 # ---------- DATA MANAGEMENT ----------
 def generate_sensor_data():
     """Generate simulated sensor data"""
-    temperature = round(random.uniform(*TEMP_RANGE), 2)
-    humidity = round(random.uniform(*HUMIDITY_RANGE), 1)
+    temperature = int(_rng.random() * _TEMP_SPAN + _TEMP_BASE) / 100
+    humidity = int(_rng.random() * _HUM_SPAN + _HUM_BASE) / 10
     
     return {
         "temperature": temperature,
         "humidity": humidity
     }
 
-def save_to_csv(data):
-    """Save data to CSV file"""
+def iter_csv_rows(batch):
+    """Yield the CSV row for each payload, refilling one shared list"""
+    row = _csv_row
+    for payload in batch:
+        row[0] = payload["timestamp"]
+        row[2] = payload["temperature"]
+        row[3] = payload["humidity"]
+        yield row
+
+def save_to_csv(batch):
+    """Save a batch of payloads to the CSV file"""
+    global _csv_rows
     try:
-        with open(CSV_FILE, "a", newline="", encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                data["timestamp"],
-                data["device_id"],
-                data["temperature"],
-                data["humidity"]
-            ])
+        _csv_writer.writerows(iter_csv_rows(batch))
+        _csv_rows += len(batch)
+        if _csv_rows >= CSV_FLUSH_ROWS:
+            _csv_file.flush()
+            _csv_rows = 0
     except Exception as e:
         logger.error("Failed to write to CSV: %s", e)
 
+def format_timestamp(now_ns):
+    """Format an epoch time in nanoseconds as an ISO 8601 UTC timestamp"""
+    global _ts_second, _ts_prefix
+    seconds, nanos = divmod(now_ns, 1_000_000_000)
+    if seconds != _ts_second:
+        _ts_second = seconds
+        _ts_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds))
+    return "%s.%06dZ" % (_ts_prefix, nanos // 1000)
+
 def create_payload(device_id, sensor_data):
-    """Create JSON payload for MQTT message"""
+    """Create payload fields for one sensor reading"""
     return {
         "device_id": device_id,
         "temperature": sensor_data["temperature"],
         "humidity": sensor_data["humidity"],
-        "timestamp": datetime.utcnow().isoformat() + "Z",
-        "message_id": f"msg_{int(time.time())}_{random.randint(1000, 9999)}"
+        "timestamp": format_timestamp(time.time_ns()),
+        "message_id": f"msg_{next(_msg_ids)}"
     }
 
+def build_message(batch):
+    """Serialize a batch of payloads into the MQTT message body"""
+    samples = ",".join([
+        _SAMPLE_TMPL % (
+            payload["temperature"],
+            payload["humidity"],
+            payload["timestamp"],
+            payload["message_id"]
+        )
+        for payload in batch
+    ])
+    return _BATCH_PREFIX + samples.encode('utf-8') + _BATCH_SUFFIX
+
 # ---------- MAIN EXECUTION ----------
 def main():
     """Main function to run the IoT publisher"""
+    log_listener.start()
     logger.info("Starting AWS IoT Core Publisher")
     
     try:
@@ -247,30 +409,58 @@ def main():
         
         # Main publishing loop
         message_count = 0
-        logger.info("Starting data publishing (interval: %ss)", PUBLISH_INTERVAL)
+        batch = []
+        logger.info("Starting data publishing (interval: %ss, %s samples per message)",
+                    PUBLISH_INTERVAL, BATCH_SIZE)
+        
+        # Per-message logs are debug only; the level check is done once here
+        _dbg = logger.isEnabledFor(logging.DEBUG)
+        summary_count = 0
+        summary_start = time.monotonic()
         
         while True:
             try:
-                # Generate and prepare data
+                # Sample sensor data
                 sensor_data = generate_sensor_data()
-                payload = create_payload(CLIENT_ID, sensor_data)
-                message = json.dumps(payload)
+                batch.append(create_payload(CLIENT_ID, sensor_data))
                 
-                # Publish to AWS IoT Core
-                if iot_client.publish_message(TOPIC, message):
-                    message_count += 1
-                    logger.info("[%s] Sent: %s", message_count, message)
+                if len(batch) >= BATCH_SIZE:
+                    # Swap first so an interrupt mid-publish cannot send it twice
+                    pending, batch = batch, []
+                    message = build_message(pending)
+                    
+                    # Publish the whole batch to AWS IoT Core
+                    if iot_client.publish_message(TOPIC, message):
+                        message_count += 1
+                        summary_count += 1
+                        if _dbg:
+                            logger.debug("[%s] Sent: %s", message_count, message.decode('utf-8'))
+                        
+                        # Save to local CSV
+                        save_to_csv(pending)
+                    else:
+                        logger.warning("Failed to publish message")
                     
-                    # Save to local CSV
-                    save_to_csv(payload)
-                else:
-                    logger.warning("Failed to publish message")
+                    elapsed = time.monotonic() - summary_start
+                    if elapsed >= SUMMARY_INTERVAL:
+                        logger.info("Published %s messages in the last %.0fs (%s total)",
+                                    summary_count, elapsed, message_count)
+                        summary_count = 0
+                        summary_start = time.monotonic()
                 
-                # Wait for next interval
-                time.sleep(PUBLISH_INTERVAL)
+                # Wait for next sample
+                time.sleep(SAMPLE_INTERVAL)
                 
             except KeyboardInterrupt:
                 logger.info("Stopping publisher...")
+                # Send the readings of the unfinished batch before leaving
+                if batch:
+                    if iot_client.publish_message(TOPIC, build_message(batch)):
+                        message_count += 1
+                        save_to_csv(batch)
+                        logger.info("Published final partial batch (%s samples)", len(batch))
+                    else:
+                        logger.warning("Failed to publish final partial batch")
                 break
             except Exception as e:
                 logger.error("Error in main loop: %s", e)
@@ -280,10 +470,15 @@ def main():
         logger.error("Fatal error: %s", e)
     
     finally:
-        # Cleanup
-        if 'iot_client' in locals():
-            iot_client.disconnect()
-        logger.info("Publisher stopped")
+        # Cleanup; the listener is stopped last, whatever fails, so queued
+        # records still reach the log
+        try:
+            if 'iot_client' in locals():
+                iot_client.disconnect()
+            close_csv()
+            logger.info("Publisher stopped")
+        finally:
+            log_listener.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,36 +1,142 @@
 import asyncio
 import websockets
+import msgspec
 import json
+import ssl
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 WS_URL = "wss://8b85tilj50.execute-api.ap-south-1.amazonaws.com/prod_multi/"
 DEVICE_ID = "RFID-Device-01"
+FLUSH_INTERVAL = 0.1  # seconds between batched writes to stdout
+RECONNECT_MIN = 1  # seconds before the first reconnect attempt
+RECONNECT_MAX = 30  # upper bound for the reconnect backoff
 
-async def main():
+class ResumableSSLContext(ssl.SSLContext):
+    """SSL context that offers the last saved TLS session on reconnect"""
+    session = None
+
+    def wrap_bio(self, incoming, outgoing, *args, **kwargs):
+        if self.session is not None and kwargs.get("session") is None:
+            kwargs["session"] = self.session
+        return super().wrap_bio(incoming, outgoing, *args, **kwargs)
+
+def create_ssl_context():
+    """Build the client TLS context shared by every connection attempt"""
+    ctx = ResumableSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ctx.load_default_certs()
+    return ctx
+
+class Reading(msgspec.Struct):
+    """One sensor reading as published by the device"""
+    device_id: str
+    temperature: float
+    humidity: float
+    timestamp: str
+    message_id: str
+
+class Batch(msgspec.Struct):
+    """A batch of readings; extra fields such as mqttTopic are ignored"""
+    device_id: str
+    samples: list[Reading]
+
+# Typed decoder built once; frames are validated and parsed in one pass
+batch_decoder = msgspec.json.Decoder(Batch)
+reading_encoder = msgspec.json.Encoder()
+RECEIVED_PREFIX = "📥 Received: ".encode("utf-8")
+
+def format_frame(msg):
+    """Render one WebSocket frame as output lines, one per reading"""
     try:
-        print(f"🔹 Connecting to {WS_URL}")
-        async with websockets.connect(WS_URL) as ws:
-            print("✅ Connected to WebSocket API Gateway")
+        batch = batch_decoder.decode(msg)
+    except msgspec.DecodeError:
+        # Not a device batch (e.g. an API Gateway error); show it as is
+        raw = msg.encode("utf-8") if isinstance(msg, str) else msg
+        return [RECEIVED_PREFIX + raw]
+    return [RECEIVED_PREFIX + reading_encoder.encode(sample) for sample in batch.samples]
+
+# A single worker keeps output batches in order and off the event loop
+output_executor = ThreadPoolExecutor(max_workers=1)
 
-            # Subscribe to a specific device
-            subscribe_msg = {
-                "action": "subscribeDevice",
-                "device_id": DEVICE_ID
-            }
-            await ws.send(json.dumps(subscribe_msg))
-            print(f"📡 Subscribed to device: {DEVICE_ID}")
+def write_frames(frames):
+    """Parse frames and write them to stdout in a single call (runs on output_executor)"""
+    lines = []
+    for msg in frames:
+        lines.extend(format_frame(msg))
+    if lines:
+        sys.stdout.flush()
+        sys.stdout.buffer.write(b"\n".join(lines) + b"\n")
+        sys.stdout.buffer.flush()
 
-            # Wait for messages
-            async for msg in ws:
-                print("📥 Received:", msg)
+async def flush_frames(frames):
+    """Hand all queued frames to the output thread and wait for the write"""
+    batch = list(frames)
+    frames.clear()
+    if batch:
+        await asyncio.get_running_loop().run_in_executor(output_executor, write_frames, batch)
 
-    except Exception as e:
-        print(f"❌ Error: {e}")
+async def drain(frames):
+    """Periodically flush received frames while the loop keeps receiving"""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await flush_frames(frames)
+
+async def main():
+    ssl_ctx = create_ssl_context()
+    backoff = RECONNECT_MIN
+    while True:
+        try:
+            print(f"🔹 Connecting to {WS_URL}")
+            async with websockets.connect(WS_URL, ssl=ssl_ctx, ping_interval=20,
+                                          ping_timeout=10, max_queue=1024) as ws:
+                ssl_object = ws.transport.get_extra_info("ssl_object")
+                if ssl_object.session_reused:
+                    print("✅ Connected to WebSocket API Gateway (TLS session resumed)")
+                else:
+                    print("✅ Connected to WebSocket API Gateway")
+                # Keep the session so the next reconnect can skip the full handshake
+                ssl_ctx.session = ssl_object.session
+                backoff = RECONNECT_MIN
+
+                # Subscribe to a specific device
+                subscribe_msg = {
+                    "action": "subscribeDevice",
+                    "device_id": DEVICE_ID
+                }
+                await ws.send(json.dumps(subscribe_msg))
+                print(f"📡 Subscribed to device: {DEVICE_ID}")
+
+                # Wait for messages
+                frames = deque()
+                writer = asyncio.create_task(drain(frames))
+                try:
+                    async for msg in ws:
+                        frames.append(msg)
+                finally:
+                    writer.cancel()
+                    await flush_frames(frames)
+
+            print("🔌 Connection closed")
+        except websockets.ConnectionClosed as e:
+            print(f"🔌 Connection lost: {e}")
+        except Exception as e:
+            print(f"❌ Error: {e}")
+
+        print(f"🔁 Reconnecting in {backoff}s")
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, RECONNECT_MAX)
 
 # For Python 3.13 / Windows compatibility:
 if __name__ == "__main__":
-    try:
-        asyncio.run(main())
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(main())
+    # uvloop's libuv event loop is faster for socket-bound work; it has no Windows support
+    if sys.platform != "win32":
+        import uvloop
+        uvloop.run(main())
+    else:
+        try:
+            asyncio.run(main())
+        except RuntimeError:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(main())